@@ -2,6 +2,7 @@
 
 import os
 from dataclasses import dataclass, fields
+from functools import cache
 from typing import Optional, Any
 from typing_extensions import TypedDict
 from langchain_core.runnables import RunnableConfig
@@ -42,8 +43,13 @@ class Configuration:
             config["configurable"] if config and "configurable" in config else {}
         )
         values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
-            for f in fields(cls)
-            if f.init
+            name: os.environ.get(name.upper(), configurable.get(name))
+            for name in _init_field_names(cls)
         }
         return cls(**{k: v for k, v in values.items() if v})
+
+
+@cache
+def _init_field_names(cls: type) -> tuple[str, ...]:
+    """Return the names of a configuration class's init fields, reflected once."""
+    return tuple(f.name for f in fields(cls) if f.init)
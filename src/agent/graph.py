@@ -1,23 +1,47 @@
 """LangGraph implementation of the research and podcast generation workflow"""
 
+import re
+
+from dotenv import load_dotenv
 from langgraph.graph import StateGraph, START, END
 from langchain_core.runnables import RunnableConfig
+from langchain_core.tracers import LangChainTracer
+from langsmith import Client
+from langsmith.utils import tracing_is_enabled
 
 from agent.state import ResearchState, ResearchStateInput, ResearchStateOutput
 from agent.utils import create_podcast_discussion, create_research_report, get_local_llm
 from agent.configuration import Configuration
-from langsmith import traceable
 
-@traceable(run_type="llm", name="Web Research", project_name="multi-modal-researcher")
-def search_research_node(state: ResearchState, config: RunnableConfig) -> dict:
+# Anything that is not a word character, space or hyphen is dropped from podcast filenames
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w \-]")
+
+# Research prompts for the local model
+SEARCH_PROMPT = "You are a world-class researcher. Find and synthesize information on the following topic: {topic}"
+VIDEO_ANALYSIS_PROMPT = "Imagine you have watched a video at the URL {video_url}. Based on its likely content, provide a summary of the topic: {topic}"
+
+# Text longer than this is sent to LangSmith as its length only
+_TRACE_TEXT_LIMIT = 500
+
+def _redact_for_trace(values):
+    """Replace long text anywhere in a run's inputs or outputs with its length."""
+    if isinstance(values, str):
+        return values if len(values) <= _TRACE_TEXT_LIMIT else f"<{len(values)} chars>"
+    if isinstance(values, dict):
+        return {key: _redact_for_trace(value) for key, value in values.items()}
+    if isinstance(values, (list, tuple)):
+        return [_redact_for_trace(value) for value in values]
+    return values
+
+async def search_research_node(state: ResearchState, config: RunnableConfig) -> dict:
     """Node that performs web search research on the topic using the local model."""
     configuration = Configuration.from_runnable_config(config)
     topic = state["topic"]
-    local_llm = get_local_llm(configuration)
+    local_llm = get_local_llm(configuration, configuration.search_temperature)
     
     print("\n>>> USING LOCAL MODEL FOR WEB RESEARCH <<<\n")
-    search_prompt = f"You are a world-class researcher. Find and synthesize information on the following topic: {topic}"
-    search_response = local_llm.invoke(search_prompt)
+    search_prompt = SEARCH_PROMPT.format_map({"topic": topic})
+    search_response = await local_llm.ainvoke(search_prompt)
     search_text = search_response.content
     
     return {
@@ -25,8 +49,7 @@ def search_research_node(state: ResearchState, config: RunnableConfig) -> dict:
         "search_sources_text": "Sources synthesized by local model." 
     }
 
-@traceable(run_type="llm", name="YouTube Video Analysis", project_name="multi-modal-researcher")
-def analyze_video_node(state: ResearchState, config: RunnableConfig) -> dict:
+async def analyze_video_node(state: ResearchState, config: RunnableConfig) -> dict:
     """Node that analyzes video content if video URL is provided using the local model."""
     configuration = Configuration.from_runnable_config(config)
     video_url = state.get("video_url")
@@ -35,23 +58,22 @@ def analyze_video_node(state: ResearchState, config: RunnableConfig) -> dict:
     if not video_url:
         return {"video_text": "No video provided for analysis."}
     
-    local_llm = get_local_llm(configuration)
+    local_llm = get_local_llm(configuration, configuration.synthesis_temperature)
     
     print("\n>>> USING LOCAL MODEL FOR VIDEO ANALYSIS <<<\n")
     # This part assumes your local model can reason about the topic and a hypothetical video
-    video_analysis_prompt = f'Imagine you have watched a video at the URL {video_url}. Based on its likely content, provide a summary of the topic: {topic}'
+    video_analysis_prompt = VIDEO_ANALYSIS_PROMPT.format_map({"video_url": video_url, "topic": topic})
     
-    video_response = local_llm.invoke(video_analysis_prompt)
+    video_response = await local_llm.ainvoke(video_analysis_prompt)
     video_text = video_response.content
     
     return {"video_text": video_text}
 
-@traceable(run_type="llm", name="Create Report", project_name="multi-modal-researcher")
-def create_report_node(state: ResearchState, config: RunnableConfig) -> dict:
+async def create_report_node(state: ResearchState, config: RunnableConfig) -> dict:
     """Node that creates a comprehensive research report using the local model."""
     configuration = Configuration.from_runnable_config(config)
     
-    report, synthesis_text = create_research_report(
+    report, synthesis_text = await create_research_report(
         topic=state["topic"],
         search_text=state.get("search_text", ""),
         video_text=state.get("video_text", ""),
@@ -62,15 +84,14 @@ def create_report_node(state: ResearchState, config: RunnableConfig) -> dict:
     
     return {"report": report, "synthesis_text": synthesis_text}
 
-@traceable(run_type="llm", name="Create Podcast", project_name="multi-modal-researcher")
-def create_podcast_node(state: ResearchState, config: RunnableConfig) -> dict:
+async def create_podcast_node(state: ResearchState, config: RunnableConfig) -> dict:
     """Node that creates a podcast discussion."""
     configuration = Configuration.from_runnable_config(config)
     
-    safe_topic = "".join(c for c in state["topic"] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    filename = f"research_podcast_{safe_topic.replace(' ', '_')}.wav"
+    safe_topic = _UNSAFE_FILENAME_CHARS.sub("", state["topic"]).rstrip().replace(" ", "_")
+    filename = f"research_podcast_{safe_topic}.wav"
     
-    podcast_script, podcast_filename = create_podcast_discussion(
+    podcast_script, podcast_filename = await create_podcast_discussion(
         topic=state["topic"],
         search_text=state.get("search_text", ""),
         video_text=state.get("video_text", ""),
@@ -82,12 +103,14 @@ def create_podcast_node(state: ResearchState, config: RunnableConfig) -> dict:
     
     return {"podcast_script": podcast_script, "podcast_filename": podcast_filename}
 
-def should_analyze_video(state: ResearchState) -> str:
-    """Conditional edge to determine if video analysis should be performed."""
-    return "analyze_video" if state.get("video_url") else "create_report"
+def route_research(state: ResearchState) -> list[str]:
+    """Fan out to the research branches that apply to this input."""
+    return ["search_research", "analyze_video"] if state.get("video_url") else ["search_research"]
 
 def create_research_graph() -> StateGraph:
     """Create and return the research workflow graph."""
+    # Load `.env` before any node resolves Configuration or LangSmith settings from the environment
+    load_dotenv()
     graph = StateGraph(
         ResearchState, 
         input=ResearchStateInput, 
@@ -97,15 +120,16 @@ def create_research_graph() -> StateGraph:
     
     graph.add_node("search_research", search_research_node)
     graph.add_node("analyze_video", analyze_video_node)
-    graph.add_node("create_report", create_report_node)
+    # Deferred so the report waits for every research branch to land
+    graph.add_node("create_report", create_report_node, defer=True)
     graph.add_node("create_podcast", create_podcast_node)
     
-    graph.add_edge(START, "search_research")
     graph.add_conditional_edges(
-        "search_research",
-        should_analyze_video,
-        {"analyze_video": "analyze_video", "create_report": "create_report"}
+        START,
+        route_research,
+        ["search_research", "analyze_video"]
     )
+    graph.add_edge("search_research", "create_report")
     graph.add_edge("analyze_video", "create_report")
     graph.add_edge("create_report", "create_podcast")
     graph.add_edge("create_podcast", END)
@@ -114,5 +138,9 @@ def create_research_graph() -> StateGraph:
 
 def create_compiled_graph():
     """Create and compile the research graph."""
-    graph = create_research_graph()
-    return graph.compile()
+    graph = create_research_graph().compile()
+    if tracing_is_enabled():
+        # A single redacting tracer covers the graph run and every node and LLM run under it
+        client = Client(hide_inputs=_redact_for_trace, hide_outputs=_redact_for_trace)
+        graph = graph.with_config(callbacks=[LangChainTracer(client=client)])
+    return graph
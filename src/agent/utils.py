@@ -1,78 +1,208 @@
 """Utilities for the research agent."""
 
+import asyncio
+import hashlib
 import os
+import shutil
+import uuid
 import wave
+from functools import cache, lru_cache
+from pathlib import Path
 from google.genai import Client, types
+from langchain_core.caches import InMemoryCache
 from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+from openai import DefaultAsyncHttpxClient
 
-load_dotenv()
+@cache
+def _gemini_client():
+    """Return the Gemini client, built on first use. It is ONLY used for Text-to-Speech."""
+    return Client(api_key=os.getenv("GEMINI_API_KEY"))
 
-# This client is ONLY used for Text-to-Speech at the very end.
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Responses from the local model, keyed by prompt and model params (incl. temperature).
+# Any change to the topic or upstream research text changes the prompt and misses.
+llm_cache = InMemoryCache(maxsize=256)
 
-def get_local_llm(configuration):
-    """Initializes and returns a local LLM client."""
+# Downstream prompts all start with the same research block and end with the task, so local
+# servers such as LM Studio or llama.cpp can reuse the cached prompt prefix between calls.
+RESEARCH_CONTEXT = "[SEARCH]\n{search_text}\n[VIDEO]\n{video_text}\n"
+SYNTHESIS_PROMPT = RESEARCH_CONTEXT + "\nYou are a research analyst. Create a comprehensive synthesis of the information above about '{topic}'. Combine insights from the search results and video content."
+SCRIPT_PROMPT = RESEARCH_CONTEXT + "\nCreate a natural, engaging podcast conversation between Tim and Monica, who are educators, about '{topic}'. The audience is other educators. Use the research above.\n\nFormat exactly like this:\nTim: [opening question]\nMonica: [expert response for educators]"
+TTS_PROMPT = "TTS the following conversation between Tim and Monica:\n{podcast_script}"
+
+# Below this much combined search + video text there is nothing worth synthesizing
+MIN_SOURCE_CHARS = 200
+INSUFFICIENT_SOURCES_SUMMARY = "Research did not return enough content to synthesize a report. Check that the local model is running and rerun the research."
+
+# Rendered podcast audio, keyed by a digest of the script and TTS settings
+TTS_CACHE_DIR = Path.home() / ".cache" / "evolveai" / "tts"
+
+@cache
+def _http_client():
+    """Return the keep-alive HTTP client shared by every local LLM call."""
+    # openai's default client settings (timeouts, pool limits, redirects), as one shared pool
+    return DefaultAsyncHttpxClient()
+
+@lru_cache(maxsize=8)
+def _build_llm(url, model, temperature):
+    """Build a local LLM client; cached so nodes share one connection pool."""
     return ChatOpenAI(
-        base_url=configuration.local_llm_url,
-        model=configuration.local_model_name,
-        temperature=configuration.synthesis_temperature,
+        base_url=url,
+        model=model,
+        temperature=temperature,
+        cache=llm_cache,
+        http_async_client=_http_client(),
         api_key="not-required" # LM Studio doesn't need an API key
     )
 
+def get_local_llm(configuration, temperature):
+    """Return the shared local LLM client for the given temperature."""
+    return _build_llm(configuration.local_llm_url, configuration.local_model_name, float(temperature))
+
+def open_wave_file(filename, channels=1, rate=24000, sample_width=2):
+    """Open a wave file for writing PCM data in the given format."""
+    wf = wave.open(filename, "wb")
+    wf.setnchannels(channels)
+    wf.setsampwidth(sample_width)
+    wf.setframerate(rate)
+    return wf
+
 def wave_file(filename, pcm, channels=1, rate=24000, sample_width=2):
     """Save PCM data to a wave file."""
-    with wave.open(filename, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(rate)
+    with open_wave_file(filename, channels, rate, sample_width) as wf:
         wf.writeframes(pcm)
 
-def create_podcast_discussion(topic, search_text, video_text, search_sources_text, video_url, filename, configuration):
+async def write_wave_stream(filename, pcm_stream, configuration):
+    """Write an async stream of PCM chunks to a wave file and return the bytes written.
+    
+    Chunks are written with `writeframesraw`, so the RIFF header is patched once on close
+    rather than after every chunk. File I/O runs in a worker thread so the event loop keeps
+    serving other coroutines.
+    """
+    wf = await asyncio.to_thread(open_wave_file, filename, configuration.tts_channels, configuration.tts_rate, configuration.tts_sample_width)
+    written = 0
+    try:
+        async for pcm in pcm_stream:
+            await asyncio.to_thread(wf.writeframesraw, pcm)
+            written += len(pcm)
+    finally:
+        await asyncio.to_thread(wf.close)
+    return written
+
+@lru_cache(maxsize=8)
+def _tts_config(tim_voice, monica_voice):
+    """Build the multi-speaker TTS request config once per voice pair."""
+    return types.GenerateContentConfig(
+        response_modalities=["AUDIO"],
+        speech_config=types.SpeechConfig(
+            multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
+                speaker_voice_configs=[
+                    types.SpeakerVoiceConfig(speaker='Tim', voice_config=types.VoiceConfig(prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=tim_voice))),
+                    types.SpeakerVoiceConfig(speaker='Monica', voice_config=types.VoiceConfig(prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=monica_voice))),
+                ]
+            )
+        )
+    )
+
+async def stream_podcast_audio(podcast_script, configuration):
+    """Yield raw PCM chunks (16-bit mono, 24kHz) of the podcast as Gemini TTS produces them."""
+    tts_prompt = TTS_PROMPT.format_map({"podcast_script": podcast_script})
+    
+    stream = await _gemini_client().aio.models.generate_content_stream(
+        model=configuration.tts_model,
+        contents=tts_prompt,
+        config=_tts_config(configuration.mike_voice, configuration.sarah_voice)
+    )
+    
+    async for chunk in stream:
+        if not chunk.candidates or not chunk.candidates[0].content:
+            continue
+        for part in chunk.candidates[0].content.parts or []:
+            if part.inline_data and part.inline_data.data:
+                yield part.inline_data.data
+
+def _has_enough_sources(search_text, video_text):
+    """Return whether the research produced enough text to be worth an LLM call."""
+    return len(search_text or "") + len(video_text or "") >= MIN_SOURCE_CHARS
+
+def _tts_cache_key(podcast_script, configuration):
+    """Digest everything that changes the rendered audio for a script."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (
+        TTS_PROMPT,
+        configuration.tts_model,
+        configuration.mike_voice,
+        configuration.sarah_voice,
+        str(configuration.tts_channels),
+        str(configuration.tts_rate),
+        str(configuration.tts_sample_width),
+        podcast_script,
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+async def create_podcast_discussion(topic, search_text, video_text, search_sources_text, video_url, filename, configuration):
     """Create a 2-speaker podcast discussion using local model for script and Gemini for TTS."""
-    local_llm = get_local_llm(configuration)
+    if not _has_enough_sources(search_text, video_text):
+        print("\n>>> NOT ENOUGH RESEARCH CONTENT, SKIPPING PODCAST <<<\n")
+        return "", None
+    
+    local_llm = get_local_llm(configuration, configuration.podcast_script_temperature)
     
     print("\n>>> USING LOCAL MODEL FOR PODCAST SCRIPT <<<\n")
-    script_prompt = f"Create a natural, engaging podcast conversation between Tim and Monica, who are educators, about '{topic}'. The audience is other educators. Use the following research: \n\nSEARCH FINDINGS:\n{search_text}\n\nVIDEO INSIGHTS:\n{video_text}\n\nFormat exactly like this:\nTim: [opening question]\nMonica: [expert response for educators]"
+    script_prompt = SCRIPT_PROMPT.format_map({"topic": topic, "search_text": search_text, "video_text": video_text})
     
-    script_response = local_llm.invoke(script_prompt)
+    script_response = await local_llm.ainvoke(script_prompt)
     podcast_script = script_response.content
     
-    print("\n>>> USING GEMINI FOR TEXT-TO-SPEECH (PODCAST AUDIO) <<<\n")
-    tts_prompt = f"TTS the following conversation between Tim and Monica:\n{podcast_script}"
+    cached = TTS_CACHE_DIR / f"{_tts_cache_key(podcast_script, configuration)}.wav"
+    if await asyncio.to_thread(cached.exists):
+        print("\n>>> REUSING CACHED PODCAST AUDIO <<<\n")
+        await asyncio.to_thread(shutil.copyfile, cached, filename)
+        print(f"Podcast saved as: {filename}")
+        return podcast_script, filename
     
-    response = genai_client.models.generate_content(
-        model=configuration.tts_model,
-        contents=tts_prompt,
-        config=types.GenerateContentConfig(
-            response_modalities=["AUDIO"],
-            speech_config=types.SpeechConfig(
-                multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
-                    speaker_voice_configs=[
-                        types.SpeakerVoiceConfig(speaker='Tim', voice_config=types.VoiceConfig(prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name="Kore"))),
-                        types.SpeakerVoiceConfig(speaker='Monica', voice_config=types.VoiceConfig(prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name="Puck"))),
-                    ]
-                )
-            )
-        )
-    )
-    
-    audio_data = response.candidates[0].content.parts[0].inline_data.data
-    wave_file(filename, audio_data, configuration.tts_channels, configuration.tts_rate, configuration.tts_sample_width)
+    print("\n>>> USING GEMINI FOR TEXT-TO-SPEECH (PODCAST AUDIO) <<<\n")
+    await asyncio.to_thread(TTS_CACHE_DIR.mkdir, parents=True, exist_ok=True)
+    partial = cached.with_name(f"{cached.stem}.{uuid.uuid4().hex}.tmp")
+    try:
+        # Write audio as it arrives instead of buffering the whole podcast in memory
+        written = await write_wave_stream(str(partial), stream_podcast_audio(podcast_script, configuration), configuration)
+        if not written:
+            raise RuntimeError("Gemini TTS returned no audio for the podcast script")
+        # Only a complete, non-empty file ever lands under the cache key
+        await asyncio.to_thread(os.replace, partial, cached)
+    finally:
+        await asyncio.to_thread(partial.unlink, missing_ok=True)
+    await asyncio.to_thread(shutil.copyfile, cached, filename)
     
     print(f"Podcast saved as: {filename}")
     return podcast_script, filename
 
-def create_research_report(topic, search_text, video_text, search_sources_text, video_url, configuration):
+def _format_report(topic, summary, video_url, search_sources_text):
+    """Assemble the markdown research report."""
+    return "".join((
+        "# Research Report: ", topic,
+        "\n\n## Executive Summary\n\n", summary,
+        "\n\n## Video Source\n- **URL**: ", str(video_url),
+        "\n\n## Additional Sources\n", search_sources_text,
+        "\n\n---\n*Report generated using multi-modal AI research combining web search and video analysis*",
+    ))
+
+async def create_research_report(topic, search_text, video_text, search_sources_text, video_url, configuration):
     """Create a comprehensive research report using the local model."""
-    local_llm = get_local_llm(configuration)
+    if not _has_enough_sources(search_text, video_text):
+        print("\n>>> NOT ENOUGH RESEARCH CONTENT, SKIPPING RESEARCH REPORT SYNTHESIS <<<\n")
+        return _format_report(topic, INSUFFICIENT_SOURCES_SUMMARY, video_url, search_sources_text), ""
+    
+    local_llm = get_local_llm(configuration, configuration.synthesis_temperature)
     
     print("\n>>> USING LOCAL MODEL FOR RESEARCH REPORT <<<\n")
-    synthesis_prompt = f"You are a research analyst. Create a comprehensive synthesis of the following information about '{topic}'. Combine insights from the search results and video content. \n\nSEARCH RESULTS:\n{search_text}\n\nVIDEO CONTENT:\n{video_text}"
+    synthesis_prompt = SYNTHESIS_PROMPT.format_map({"topic": topic, "search_text": search_text, "video_text": video_text})
     
-    synthesis_response = local_llm.invoke(synthesis_prompt)
+    synthesis_response = await local_llm.ainvoke(synthesis_prompt)
     synthesis_text = synthesis_response.content
     
-    report = f"# Research Report: {topic}\n\n## Executive Summary\n\n{synthesis_text}\n\n## Video Source\n- **URL**: {video_url}\n\n## Additional Sources\n{search_sources_text}\n\n---\n*Report generated using multi-modal AI research combining web search and video analysis*"
+    report = _format_report(topic, synthesis_text, video_url, search_sources_text)
     
     return report, synthesis_text